@@ -4,8 +4,13 @@ Handles environment variables and settings
 """
 import os
 from typing import Optional
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
+# Questions in a typical suggested-questions batch, used to size the default
+# /chat/batch rate limit
+TYPICAL_BATCH_QUESTIONS = 5
+
 
 class Settings(BaseSettings):
     """Application settings loaded from environment variables"""
@@ -19,6 +24,7 @@ class Settings(BaseSettings):
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama2")
+    LLM_FALLBACK_PROVIDER: str = os.getenv("LLM_FALLBACK_PROVIDER", "")  # used when LLM_PROVIDER is unavailable
     
     # Embedding Configuration
     EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "openai")  # openai, gemini, or local
@@ -32,6 +38,9 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
     TOP_K_RESULTS: int = int(os.getenv("TOP_K_RESULTS", "3"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    INDEXING_MAX_RETRIES: int = int(os.getenv("INDEXING_MAX_RETRIES", "5"))  # retries per shed batch
+    MAX_BATCH_QUESTIONS: int = int(os.getenv("MAX_BATCH_QUESTIONS", "20"))
     
     # API Configuration
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
@@ -43,6 +52,28 @@ class Settings(BaseSettings):
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+    # Resolved after loading, see _default_batch_rate_limit
+    BATCH_RATE_LIMIT_PER_MINUTE: Optional[int] = None
+    
+    # Provider Admission Control
+    PROVIDER_MAX_CONCURRENCY: int = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "4"))
+    PROVIDER_MAX_QUEUE_DEPTH: int = int(os.getenv("PROVIDER_MAX_QUEUE_DEPTH", "32"))
+    # Per-lane "lane=concurrency:queue_depth" overrides, e.g. a local Ollama that serves one request at a time
+    PROVIDER_LANE_LIMITS: str = os.getenv("PROVIDER_LANE_LIMITS", "llm:ollama=1:8,embedding:local=2:16")
+    PROVIDER_QUEUE_TIMEOUT: float = float(os.getenv("PROVIDER_QUEUE_TIMEOUT", "20"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_TIMEOUT: float = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+    
+    # Vector stores kept in memory (one per video)
+    MAX_CACHED_VIDEOS: int = int(os.getenv("MAX_CACHED_VIDEOS", "8"))
+    
+    @model_validator(mode="after")
+    def _default_batch_rate_limit(self) -> "Settings":
+        """Give typical batches the same per-question LLM budget as /chat"""
+        if self.BATCH_RATE_LIMIT_PER_MINUTE is None:
+            batch_size = max(1, min(self.MAX_BATCH_QUESTIONS, TYPICAL_BATCH_QUESTIONS))
+            self.BATCH_RATE_LIMIT_PER_MINUTE = max(1, self.RATE_LIMIT_PER_MINUTE // batch_size)
+        return self
     
     class Config:
         env_file = ".env"
@@ -2,21 +2,27 @@
 Embedding generation using various providers
 Supports OpenAI, Gemini, and local embeddings
 """
+from contextlib import contextmanager
 from typing import List
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain.schema.embeddings import Embeddings
 import os
+import threading
 
 from config import settings
+from scheduler import Priority, get_scheduler
 
 
-class EmbeddingManager:
+class EmbeddingManager(Embeddings):
     """Manages embedding generation across different providers"""
     
     def __init__(self):
         """Initialize embedding manager based on configuration"""
         self.embeddings = self._initialize_embeddings()
+        self.scheduler = get_scheduler(f"embedding:{settings.EMBEDDING_PROVIDER.lower()}")
+        self._local = threading.local()
     
     def _initialize_embeddings(self):
         """Initialize embeddings based on provider setting"""
@@ -48,17 +54,39 @@ class EmbeddingManager:
         else:
             raise ValueError(f"Unsupported embedding provider: {provider}")
     
+    @contextmanager
+    def prioritized(self, priority: Priority):
+        """
+        Run embed_documents calls from this thread at the given priority
+        
+        Args:
+            priority: Scheduling priority for documents embedded in the block
+        """
+        previous = getattr(self._local, "priority", Priority.INDEXING)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+    
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
         Generate embeddings for a list of documents
         
+        Runs at indexing priority so queries are served first under load,
+        unless overridden with prioritized().
+        
         Args:
             texts: List of text strings to embed
         
         Returns:
             List of embedding vectors
         """
-        return self.embeddings.embed_documents(texts)
+        priority = getattr(self._local, "priority", Priority.INDEXING)
+        return self.scheduler.run(
+            self.embeddings.embed_documents, texts,
+            priority=priority, latency_key="documents"
+        )
     
     def embed_query(self, text: str) -> List[float]:
         """
@@ -70,5 +98,27 @@ class EmbeddingManager:
         Returns:
             Embedding vector
         """
-        return self.embeddings.embed_query(text)
-
+        return self.scheduler.run(
+            self.embeddings.embed_query, text,
+            priority=Priority.ANSWER, latency_key="query"
+        )
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for several queries in one provider call
+        
+        Every supported provider embeds queries and documents identically in
+        the pinned versions (langchain-google-genai 0.0.5 ignores the query
+        task type), so the batch goes through embed_documents and matches
+        embed_query for each text.
+        
+        Args:
+            texts: Query texts to embed
+        
+        Returns:
+            List of embedding vectors, in the same order as texts
+        """
+        return self.scheduler.run(
+            self.embeddings.embed_documents, texts,
+            priority=Priority.ANSWER, latency_key="query"
+        )
@@ -5,7 +5,7 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import uvicorn
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -14,6 +14,7 @@ from slowapi.errors import RateLimitExceeded
 from config import settings
 from transcript_loader import TranscriptLoader
 from rag_pipeline import RAGPipeline
+from scheduler import ProviderOverloaded
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -27,6 +28,16 @@ limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+
+@app.exception_handler(ProviderOverloaded)
+async def provider_overloaded_handler(request: Request, exc: ProviderOverloaded):
+    """Shed load with 503 and a Retry-After hint when a provider is saturated"""
+    return JSONResponse(
+        status_code=503,
+        content={"answer": "", "success": False, "error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # CORS configuration for Chrome Extension
 app.add_middleware(
     CORSMiddleware,
@@ -40,9 +51,6 @@ app.add_middleware(
 transcript_loader = TranscriptLoader(cache_dir=settings.CACHE_DIR)
 rag_pipeline = RAGPipeline()
 
-# Store current video processing state
-video_cache = {}
-
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -56,6 +64,31 @@ class ChatResponse(BaseModel):
     answer: str
     success: bool
     error: Optional[str] = None
+    # False while the end of the transcript is still being indexed (or failed
+    # to index), so "not available in the video" may be premature
+    indexing_complete: bool = True
+
+
+class BatchChatRequest(BaseModel):
+    """Batch chat request model"""
+    video_id: str
+    questions: List[str]
+
+
+class BatchChatResult(BaseModel):
+    """Answer for a single question in a batch"""
+    question: str
+    answer: str
+    success: bool
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    """Batch chat response model"""
+    results: List[BatchChatResult]
+    success: bool
+    error: Optional[str] = None
+    indexing_complete: bool = True
 
 
 class HealthResponse(BaseModel):
@@ -64,6 +97,24 @@ class HealthResponse(BaseModel):
     message: str
 
 
+def ensure_video_processed(video_id: str):
+    """
+    Fetch and index a video's transcript if it is not loaded or only partly indexed
+    
+    Args:
+        video_id: YouTube video ID
+    
+    Raises:
+        ValueError: If the transcript cannot be fetched
+        ProviderOverloaded: If the first batch is shed by the embedding provider
+    """
+    # Also resumes a video whose tail failed to index on an earlier request
+    if rag_pipeline.needs_indexing(video_id):
+        segments = transcript_loader.iter_segments(video_id)
+        # Answer from the first indexed batch while the rest is embedded
+        rag_pipeline.process_segments(video_id, segments, background=True)
+
+
 @app.get("/", response_model=HealthResponse)
 async def root():
     """Root endpoint"""
@@ -78,7 +129,7 @@ async def health_check():
 
 @app.post("/chat", response_model=ChatResponse)
 @limiter.limit(f"{settings.RATE_LIMIT_PER_MINUTE}/minute")
-async def chat(request: Request, chat_request: ChatRequest):
+def chat(request: Request, chat_request: ChatRequest):
     """
     Main chat endpoint for answering questions about YouTube videos
     
@@ -96,41 +147,26 @@ async def chat(request: Request, chat_request: ChatRequest):
         if not user_query:
             raise HTTPException(status_code=400, detail="User query cannot be empty")
         
-        # Check if we need to process this video
-        if video_id not in video_cache:
-            # Fetch and process transcript
-            try:
-                transcript_data = transcript_loader.fetch_transcript(video_id)
-                transcript_text = transcript_loader.get_full_text(video_id)
-                
-                # Process transcript through RAG pipeline
-                rag_pipeline.process_transcript(video_id, transcript_text)
-                
-                # Cache the video ID
-                video_cache[video_id] = True
-                
-            except ValueError as e:
-                return ChatResponse(
-                    answer="",
-                    success=False,
-                    error=str(e)
-                )
-        
-        # Ensure RAG pipeline is set up for this video
-        if rag_pipeline.current_video_id != video_id:
-            transcript_text = transcript_loader.get_full_text(video_id)
-            rag_pipeline.process_transcript(video_id, transcript_text)
-            video_cache[video_id] = True
+        # Fetch and process transcript if needed
+        try:
+            ensure_video_processed(video_id)
+        except ValueError as e:
+            return ChatResponse(
+                answer="",
+                success=False,
+                error=str(e)
+            )
         
         # Get answer from RAG pipeline
-        result = rag_pipeline.answer_question(user_query)
+        result = rag_pipeline.answer_question(user_query, video_id=video_id)
         
         return ChatResponse(
             answer=result["answer"],
-            success=True
+            success=True,
+            indexing_complete=rag_pipeline.is_fully_indexed(video_id)
         )
         
-    except HTTPException:
+    except (HTTPException, ProviderOverloaded):
         raise
     except Exception as e:
         return ChatResponse(
@@ -140,6 +176,72 @@ async def chat(request: Request, chat_request: ChatRequest):
         )
 
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+@limiter.limit(f"{settings.BATCH_RATE_LIMIT_PER_MINUTE}/minute")
+def chat_batch(request: Request, batch_request: BatchChatRequest):
+    """
+    Answer several questions about one YouTube video in a single call
+    
+    Args:
+        request: FastAPI request object (for rate limiting)
+        batch_request: Batch request with video_id and questions
+    
+    Returns:
+        BatchChatResponse with one result per question
+    """
+    try:
+        video_id = batch_request.video_id
+        questions = [question.strip() for question in batch_request.questions]
+        
+        if not questions:
+            raise HTTPException(status_code=400, detail="Questions cannot be empty")
+        if len(questions) > settings.MAX_BATCH_QUESTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.MAX_BATCH_QUESTIONS} questions per batch"
+            )
+        if not all(questions):
+            raise HTTPException(status_code=400, detail="User query cannot be empty")
+        
+        # Fetch and process transcript if needed
+        try:
+            ensure_video_processed(video_id)
+        except ValueError as e:
+            return BatchChatResponse(results=[], success=False, error=str(e))
+        
+        # Get answers from RAG pipeline
+        results = rag_pipeline.answer_questions(questions, video_id=video_id)
+        
+        return BatchChatResponse(
+            results=[
+                BatchChatResult(
+                    question=result["question"],
+                    answer=result["answer"],
+                    success=result["success"],
+                    error=result["error"]
+                )
+                for result in results
+            ],
+            success=all(result["success"] for result in results),
+            indexing_complete=rag_pipeline.is_fully_indexed(video_id)
+        )
+        
+    except ProviderOverloaded as e:
+        return JSONResponse(
+            status_code=503,
+            content=BatchChatResponse(results=[], success=False, error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return BatchChatResponse(
+            results=[],
+            success=False,
+            error=f"Internal server error: {str(e)}"
+        )
+
+
 @app.post("/reset/{video_id}")
 async def reset_video(video_id: str):
     """
@@ -148,11 +250,7 @@ async def reset_video(video_id: str):
     Args:
         video_id: YouTube video ID to reset
     """
-    if video_id in video_cache:
-        del video_cache[video_id]
-    
-    if rag_pipeline.current_video_id == video_id:
-        rag_pipeline.reset()
+    rag_pipeline.reset(video_id)
     
     return {"status": "success", "message": f"Reset pipeline for video {video_id}"}
 
@@ -2,12 +2,17 @@
 RAG Pipeline Implementation
 Handles document chunking, vector store creation, and retrieval
 """
+import itertools
 import os
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Optional
+import faiss
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS, Chroma
 from langchain.schema import Document
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain_openai import OpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -15,6 +20,16 @@ from langchain_community.llms import Ollama
 
 from config import settings
 from embeddings import EmbeddingManager
+from scheduler import Priority, ProviderOverloaded, get_scheduler
+
+
+class _Ingestion:
+    """State shared by requests waiting on one transcript ingestion"""
+    
+    def __init__(self):
+        self.first_batch = threading.Event()
+        self.cancelled = threading.Event()
+        self.error: Optional[Exception] = None
 
 
 class RAGPipeline:
@@ -23,14 +38,23 @@ class RAGPipeline:
     def __init__(self):
         """Initialize RAG pipeline with embeddings and vector store"""
         self.embedding_manager = EmbeddingManager()
-        self.vector_store = None
-        self.qa_chain = None
+        self.vector_stores = OrderedDict()
         self.current_video_id = None
+        self._llms = {}
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._ingestions: Dict[str, _Ingestion] = {}
+        # video_id -> chunks indexed so far, for videos whose tail is not indexed
+        self._incomplete: Dict[str, int] = {}
     
-    def _get_llm(self):
-        """Initialize LLM based on provider configuration"""
-        provider = settings.LLM_PROVIDER.lower()
-        
+    def _get_llm(self, provider: str):
+        """Initialize LLM for a provider, reusing previously created instances"""
+        if provider not in self._llms:
+            self._llms[provider] = self._create_llm(provider)
+        return self._llms[provider]
+    
+    def _create_llm(self, provider: str):
+        """Create LLM instance for the given provider"""
         if provider == "openai":
             if not settings.OPENAI_API_KEY:
                 raise ValueError("OPENAI_API_KEY not set")
@@ -82,89 +106,454 @@ Answer:"""
             input_variables=["context", "question"]
         )
     
-    def process_transcript(self, video_id: str, transcript_text: str):
+    def _llm_providers(self) -> List[str]:
+        """Configured LLM providers in fallback order"""
+        providers = [settings.LLM_PROVIDER.lower()]
+        fallback = settings.LLM_FALLBACK_PROVIDER.lower()
+        if fallback and fallback not in providers:
+            providers.append(fallback)
+        return providers
+    
+    def _generate(self, prompt_text: str, priority: Priority = Priority.ANSWER) -> str:
         """
-        Process transcript and create vector store
+        Run an LLM generation under admission control
+        
+        Falls back to LLM_FALLBACK_PROVIDER when the primary provider is
+        overloaded, circuit-broken or failing.
         
         Args:
-            video_id: YouTube video ID
-            transcript_text: Full transcript text
+            prompt_text: Fully formatted prompt
+            priority: Scheduling priority for the call
+        
+        Returns:
+            Generated text
+        
+        Raises:
+            ProviderOverloaded: If any provider was shed or circuit-broken and
+                none succeeded, so clients get a Retry-After
+        """
+        last_error = None
+        overloaded = None
+        for provider in self._llm_providers():
+            scheduler = get_scheduler(f"llm:{provider}")
+            try:
+                llm = self._get_llm(provider)
+                result = scheduler.run(llm.invoke, prompt_text, priority=priority)
+            except ProviderOverloaded as e:
+                overloaded = overloaded or e
+                continue
+            except Exception as e:
+                last_error = e
+                continue
+            # Chat models return a message, completion models a string
+            return getattr(result, "content", result)
+        raise overloaded or last_error
+    
+    def _iter_chunks(self, video_id: str, segments: Iterable[Dict]) -> Iterator[Document]:
         """
-        # Reset if video changed
-        if self.current_video_id != video_id:
-            self.vector_store = None
-            self.qa_chain = None
-            self.current_video_id = video_id
+        Group transcript segments into overlapping chunks without joining the full text
+        
+        Args:
+            video_id: YouTube video ID
+            segments: Transcript segments with 'text' and 'start'
         
-        # Split transcript into chunks
+        Yields:
+            Chunk documents with video_id and start-time metadata
+        """
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=settings.CHUNK_SIZE,
             chunk_overlap=settings.CHUNK_OVERLAP,
             length_function=len
         )
+        buffer = []
+        length = 0
+        has_new_text = False
         
-        # Create documents
-        documents = [Document(page_content=transcript_text, metadata={"video_id": video_id})]
-        chunks = text_splitter.split_documents(documents)
+        for segment in segments:
+            text = segment.get("text", "").strip()
+            if not text:
+                continue
+            start = segment.get("start", 0)
+            pieces = text_splitter.split_text(text) if len(text) > settings.CHUNK_SIZE else [text]
+            
+            for piece in pieces:
+                if has_new_text and length + len(piece) > settings.CHUNK_SIZE:
+                    yield Document(
+                        page_content=" ".join(item for _, item in buffer),
+                        metadata={"video_id": video_id, "start": buffer[0][0]}
+                    )
+                    # Carry trailing segments over as overlap for the next chunk
+                    overlap = []
+                    overlap_length = 0
+                    for item in reversed(buffer):
+                        if overlap_length + len(item[1]) + 1 > settings.CHUNK_OVERLAP:
+                            break
+                        overlap.insert(0, item)
+                        overlap_length += len(item[1]) + 1
+                    buffer, length, has_new_text = overlap, overlap_length, False
+                
+                if length + len(piece) > settings.CHUNK_SIZE:
+                    # Overlap does not fit alongside this piece
+                    buffer, length = [], 0
+                
+                buffer.append((start, piece))
+                length += len(piece) + 1
+                has_new_text = True
         
-        # Create vector store
-        if settings.VECTOR_DB_TYPE.lower() == "faiss":
-            self.vector_store = FAISS.from_documents(
-                chunks,
-                self.embedding_manager.embeddings
+        if has_new_text:
+            yield Document(
+                page_content=" ".join(item for _, item in buffer),
+                metadata={"video_id": video_id, "start": buffer[0][0]}
             )
-        elif settings.VECTOR_DB_TYPE.lower() == "chroma":
-            # Use in-memory Chroma for simplicity
-            self.vector_store = Chroma.from_documents(
-                chunks,
-                self.embedding_manager.embeddings
+    
+    def _iter_batches(self, chunks: Iterator[Document]) -> Iterator[List[Document]]:
+        """Group chunks into embedding batches of EMBEDDING_BATCH_SIZE"""
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= settings.EMBEDDING_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def _create_vector_store(self, batch: List[Document]):
+        """Create a vector store from the first batch of chunks"""
+        # A request is waiting on the first batch, so it is embedded as an answer
+        with self.embedding_manager.prioritized(Priority.ANSWER):
+            if settings.VECTOR_DB_TYPE.lower() == "faiss":
+                texts = [doc.page_content for doc in batch]
+                vectors = self.embedding_manager.embed_documents(texts)
+                return FAISS.from_embeddings(
+                    list(zip(texts, vectors)),
+                    self.embedding_manager,
+                    metadatas=[doc.metadata for doc in batch]
+                )
+            elif settings.VECTOR_DB_TYPE.lower() == "chroma":
+                # Use in-memory Chroma for simplicity
+                return Chroma.from_documents(
+                    batch,
+                    self.embedding_manager
+                )
+            else:
+                raise ValueError(f"Unsupported vector DB type: {settings.VECTOR_DB_TYPE}")
+    
+    def _add_batch(self, vector_store, batch: List[Document]):
+        """Embed a batch of chunks and add it to an existing vector store"""
+        if not isinstance(vector_store, FAISS):
+            vector_store.add_documents(batch)
+            return
+        
+        texts = [doc.page_content for doc in batch]
+        vectors = self.embedding_manager.embed_documents(texts)
+        # FAISS is not safe to search while vectors are being added
+        with self._index_lock:
+            vector_store.add_embeddings(
+                list(zip(texts, vectors)),
+                metadatas=[doc.metadata for doc in batch]
             )
+    
+    def _add_batch_with_retry(self, vector_store, batch: List[Document], ingestion: _Ingestion):
+        """Add a tail batch, backing off and retrying while the provider sheds it"""
+        for attempt in range(settings.INDEXING_MAX_RETRIES + 1):
+            try:
+                self._add_batch(vector_store, batch)
+                return
+            except ProviderOverloaded as e:
+                if attempt == settings.INDEXING_MAX_RETRIES:
+                    raise
+                delay = min(60, max(e.retry_after, 2 ** attempt))
+                # Wakes early if the ingestion is cancelled
+                if ingestion.cancelled.wait(delay):
+                    return
+    
+    def _cancel_ingestion(self, video_id: str):
+        """Stop a running ingestion and forget its state (caller holds _lock)"""
+        ingestion = self._ingestions.pop(video_id, None)
+        if ingestion is not None:
+            ingestion.cancelled.set()
+            ingestion.first_batch.set()
+        self._incomplete.pop(video_id, None)
+    
+    def _ingest(self, video_id: str, segments: Iterable[Dict], ingestion: _Ingestion):
+        """
+        Stream segments into a vector store, publishing it after the first batch
+        
+        If an earlier ingestion of the video stopped partway, indexing resumes
+        after the last chunk it added instead of starting over.
+        """
+        with self._lock:
+            indexed = self._incomplete.get(video_id, 0)
+            vector_store = self.vector_stores.get(video_id) if indexed else None
+        if vector_store is not None:
+            # Already queryable; only the tail is left
+            ingestion.first_batch.set()
         else:
-            raise ValueError(f"Unsupported vector DB type: {settings.VECTOR_DB_TYPE}")
-        
-        # Create QA chain
-        prompt = self._create_prompt_template()
-        llm = self._get_llm()
-        
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=self.vector_store.as_retriever(
-                search_kwargs={"k": settings.TOP_K_RESULTS}
-            ),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": prompt}
-        )
+            indexed = 0
+        
+        chunks = itertools.islice(self._iter_chunks(video_id, segments), indexed, None)
+        for batch in self._iter_batches(chunks):
+            if ingestion.cancelled.is_set():
+                return
+            
+            if vector_store is not None:
+                # Once published, a failed tail batch leaves the partial index in place
+                self._add_batch_with_retry(vector_store, batch, ingestion)
+                with self._lock:
+                    if ingestion.cancelled.is_set():
+                        return
+                    self._incomplete[video_id] += len(batch)
+                continue
+            
+            vector_store = self._create_vector_store(batch)
+            with self._lock:
+                if ingestion.cancelled.is_set():
+                    return
+                self.vector_stores[video_id] = vector_store
+                self.vector_stores.move_to_end(video_id)
+                self._incomplete[video_id] = len(batch)
+                while len(self.vector_stores) > settings.MAX_CACHED_VIDEOS:
+                    evicted_id, _ = self.vector_stores.popitem(last=False)
+                    self._cancel_ingestion(evicted_id)
+                self.current_video_id = video_id
+            ingestion.first_batch.set()
+        
+        if vector_store is None:
+            raise ValueError(f"Transcript for video {video_id} is empty")
+        
+        with self._lock:
+            if not ingestion.cancelled.is_set():
+                self._incomplete.pop(video_id, None)
     
-    def answer_question(self, question: str) -> Dict[str, any]:
+    def process_segments(self, video_id: str, segments: Iterable[Dict], background: bool = False):
         """
-        Answer a question using RAG
+        Process transcript segments through a streaming ingestion pipeline
+        
+        Segments are grouped into chunks, embedded in batches of
+        EMBEDDING_BATCH_SIZE and added to the index incrementally, so memory
+        stays bounded by the batch size rather than the transcript length.
+        Concurrent calls for the same video join the running ingestion, and a
+        call for a partially indexed video resumes where indexing stopped.
         
         Args:
-            question: User's question
+            video_id: YouTube video ID
+            segments: Iterable of transcript segments with 'text' and 'start'
+            background: Return as soon as the first batch is queryable and
+                index the rest of the transcript in a background thread
         
-        Returns:
-            Dictionary with answer and metadata
+        Raises:
+            ValueError: If the transcript is empty or indexing fails before
+                the first batch is queryable
+            ProviderOverloaded: If the first batch is shed by the embedding provider
         """
-        if self.qa_chain is None:
-            raise ValueError("Transcript not processed. Call process_transcript first.")
+        with self._lock:
+            ingestion = self._ingestions.get(video_id)
+            if ingestion is not None and ingestion.first_batch.is_set():
+                # Already queryable and still indexing the tail; only reset() restarts it
+                return
+            in_progress = ingestion is not None
+            if not in_progress:
+                ingestion = _Ingestion()
+                self._ingestions[video_id] = ingestion
+        
+        if in_progress:
+            # Another request is already indexing this video
+            ingestion.first_batch.wait()
+        else:
+            def run():
+                try:
+                    self._ingest(video_id, segments, ingestion)
+                except Exception as e:
+                    ingestion.error = e
+                    print(f"Error indexing video {video_id}: {e}")
+                finally:
+                    with self._lock:
+                        if self._ingestions.get(video_id) is ingestion:
+                            del self._ingestions[video_id]
+                    ingestion.first_batch.set()
+            
+            if not background:
+                run()
+            else:
+                threading.Thread(target=run, daemon=True).start()
+                ingestion.first_batch.wait()
+        
+        if not self.has_video(video_id):
+            if ingestion.error is not None:
+                raise ingestion.error
+            raise ValueError(f"Failed to index transcript for video {video_id}")
+    
+    def process_transcript(self, video_id: str, transcript_text: str):
+        """
+        Process transcript and create vector store
         
-        result = self.qa_chain({"query": question})
+        Args:
+            video_id: YouTube video ID
+            transcript_text: Full transcript text
+        """
+        self.process_segments(video_id, [{"text": transcript_text, "start": 0}])
+    
+    def has_video(self, video_id: str) -> bool:
+        """Check whether a vector store is loaded for the video"""
+        with self._lock:
+            return video_id in self.vector_stores
+    
+    def needs_indexing(self, video_id: str) -> bool:
+        """
+        Check whether process_segments should run for the video
+        
+        True if the video is not loaded, or if its tail failed to index and
+        no ingestion is running to finish it.
+        """
+        with self._lock:
+            if video_id not in self.vector_stores:
+                return True
+            return video_id in self._incomplete and video_id not in self._ingestions
+    
+    def is_fully_indexed(self, video_id: str) -> bool:
+        """
+        Check whether the whole transcript of a loaded video is indexed
+        
+        False while the tail is still being embedded, or if tail indexing
+        failed and only part of the transcript is searchable.
+        """
+        with self._lock:
+            return video_id in self.vector_stores and video_id not in self._incomplete
+    
+    def _get_vector_store(self, video_id: Optional[str]):
+        """Look up the vector store for a video (default: current video)"""
+        with self._lock:
+            video_id = video_id or self.current_video_id
+            vector_store = self.vector_stores.get(video_id)
+            if vector_store is not None:
+                self.vector_stores.move_to_end(video_id)
+        if vector_store is None:
+            raise ValueError("Transcript not processed. Call process_transcript first.")
+        return vector_store
+    
+    def _build_answer(self, question: str, source_documents: List[Document]) -> Dict[str, any]:
+        """Generate an answer from retrieved chunks and format the result"""
+        context = "\n\n".join(doc.page_content for doc in source_documents)
+        prompt_text = self._create_prompt_template().format(context=context, question=question)
+        answer = self._generate(prompt_text)
         
         return {
-            "answer": result["result"],
+            "answer": answer,
             "source_documents": [
                 {
                     "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
                     "metadata": doc.metadata
                 }
-                for doc in result.get("source_documents", [])
+                for doc in source_documents
             ]
         }
     
-    def reset(self):
-        """Reset pipeline for new video"""
-        self.vector_store = None
-        self.qa_chain = None
-        self.current_video_id = None
-
+    def answer_question(self, question: str, video_id: Optional[str] = None) -> Dict[str, any]:
+        """
+        Answer a question using RAG
+        
+        Args:
+            question: User's question
+            video_id: YouTube video ID (default: most recently processed video)
+        
+        Returns:
+            Dictionary with answer and metadata
+        """
+        vector_store = self._get_vector_store(video_id)
+        query_vector = self.embedding_manager.embed_query(question)
+        with self._index_lock:
+            source_documents = vector_store.similarity_search_by_vector(
+                query_vector, k=settings.TOP_K_RESULTS
+            )
+        return self._build_answer(question, source_documents)
+    
+    def _search_batch(self, vector_store, query_vectors: List[List[float]]) -> List[List[Document]]:
+        """Top-k search for several query vectors, in one FAISS call when possible"""
+        k = settings.TOP_K_RESULTS
+        if isinstance(vector_store, FAISS) and all(
+            hasattr(vector_store, attr) for attr in ("index", "docstore", "index_to_docstore_id")
+        ):
+            return self._faiss_search_batch(vector_store, query_vectors, k)
+        return [vector_store.similarity_search_by_vector(vector, k=k) for vector in query_vectors]
+    
+    def _faiss_search_batch(self, vector_store: FAISS, query_vectors: List[List[float]], k: int) -> List[List[Document]]:
+        """
+        Search several query vectors with a single faiss index.search call
+        
+        Mirrors FAISS.similarity_search_with_score_by_vector from
+        langchain-community==0.0.10 (pinned in requirements.txt) without
+        filters or score thresholds, which this pipeline never sets. It relies
+        on the private _normalize_L2, index_to_docstore_id and docstore
+        attributes, so re-check it against similarity_search_by_vector when
+        upgrading langchain-community.
+        """
+        vectors = np.array(query_vectors, dtype=np.float32)
+        if getattr(vector_store, "_normalize_L2", False):
+            faiss.normalize_L2(vectors)
+        _, indices = vector_store.index.search(vectors, k)
+        
+        results = []
+        for row in indices:
+            docs = []
+            for i in row:
+                # FAISS pads with -1 when the index holds fewer than k vectors
+                if i == -1:
+                    continue
+                doc = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+                if isinstance(doc, Document):
+                    docs.append(doc)
+            results.append(docs)
+        return results
+    
+    def answer_questions(self, questions: List[str], video_id: Optional[str] = None) -> List[Dict[str, any]]:
+        """
+        Answer several questions about one video
+        
+        Queries are embedded in one provider call and searched in one
+        vector-store call; LLM generations then run concurrently. A failed
+        generation is reported on its own result instead of failing the batch.
+        
+        Args:
+            questions: User questions
+            video_id: YouTube video ID (default: most recently processed video)
+        
+        Returns:
+            List of dictionaries with question, answer, success, error and
+            source_documents, in the same order as questions
+        """
+        vector_store = self._get_vector_store(video_id)
+        query_vectors = self.embedding_manager.embed_queries(questions)
+        with self._index_lock:
+            retrieved = self._search_batch(vector_store, query_vectors)
+        
+        def run(question: str, source_documents: List[Document]) -> Dict[str, any]:
+            try:
+                result = self._build_answer(question, source_documents)
+            except Exception as e:
+                return {"question": question, "answer": "", "success": False,
+                        "error": str(e), "source_documents": []}
+            return {"question": question, "success": True, "error": None, **result}
+        
+        max_workers = max(1, min(len(questions), settings.PROVIDER_MAX_CONCURRENCY))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, questions, retrieved))
+    
+    def reset(self, video_id: Optional[str] = None):
+        """
+        Reset pipeline for a video, or for all videos if none is given
+        
+        Args:
+            video_id: YouTube video ID to drop
+        """
+        with self._lock:
+            if video_id is None:
+                for ingesting_id in list(self._ingestions):
+                    self._cancel_ingestion(ingesting_id)
+                self._incomplete.clear()
+                self.vector_stores.clear()
+                self.current_video_id = None
+                return
+            self._cancel_ingestion(video_id)
+            self.vector_stores.pop(video_id, None)
+            if self.current_video_id == video_id:
+                self.current_video_id = None
@@ -0,0 +1,297 @@
+"""
+Provider-aware admission control
+Bounds concurrency, queues and sheds load, and circuit-breaks calls to
+embedding and LLM providers
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+# Shrink the concurrency limit once average latency of a call class exceeds
+# this multiple of the best latency recently observed for that class
+LATENCY_TOLERANCE = 2.0
+
+# Seconds assumed per call before any latency has been observed
+DEFAULT_SERVICE_TIME = 1.0
+
+
+class Priority(IntEnum):
+    """Scheduling priority for provider calls (lower runs first)"""
+    ANSWER = 0
+    INDEXING = 1
+
+
+class ProviderOverloaded(Exception):
+    """Raised when a provider call is rejected instead of queued"""
+
+    def __init__(self, provider: str, retry_after: int, reason: str = "overloaded"):
+        self.provider = provider
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(
+            f"Provider '{provider}' is {reason}, retry after {retry_after}s"
+        )
+
+
+class CircuitOpenError(ProviderOverloaded):
+    """Raised when a provider's circuit breaker is open"""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(provider, retry_after, reason="unavailable")
+
+
+class ProviderScheduler:
+    """Admission control for a single provider lane"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue_depth: int,
+        queue_timeout: float,
+        failure_threshold: int,
+        reset_timeout: float
+    ):
+        """
+        Initialize scheduler for a provider lane
+
+        Args:
+            name: Lane name, e.g. "llm:openai" or "embedding:local"
+            max_concurrency: Upper bound on in-flight calls; the effective
+                limit adapts below it as provider latency changes
+            max_queue_depth: Maximum number of waiting calls before shedding
+            queue_timeout: Seconds a call may wait for a slot before shedding
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_depth = max(1, max_queue_depth)
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting: List[list] = []
+        self._seq = itertools.count()
+        # latency key -> [average, baseline] seconds of successful calls
+        self._latency: Dict[str, List[float]] = {}
+        self._limit = float(self.max_concurrency)
+
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def concurrency_limit(self) -> int:
+        """Current adaptive limit on in-flight calls"""
+        return max(1, int(self._limit))
+
+    def _service_time(self, latency_key: Optional[str] = None) -> float:
+        """Average service time for a call class (slowest class if not given)"""
+        if latency_key in self._latency:
+            return self._latency[latency_key][0]
+        if latency_key is None and self._latency:
+            return max(stats[0] for stats in self._latency.values())
+        return DEFAULT_SERVICE_TIME
+
+    def _retry_after(self, latency_key: Optional[str] = None) -> int:
+        """Estimate seconds until a new call could be admitted"""
+        backlog = len(self._waiting) + 1
+        return max(1, math.ceil(self._service_time(latency_key) * backlog / self.concurrency_limit))
+
+    def _check_circuit(self) -> bool:
+        """
+        Reject the call if the circuit is open, allowing one half-open trial
+
+        Returns:
+            True if this call is the half-open trial
+        """
+        if self._opened_at is None:
+            return False
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        if remaining > 0:
+            raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+        if self._trial_in_flight:
+            raise CircuitOpenError(self.name, self._retry_after())
+        self._trial_in_flight = True
+        return True
+
+    def _acquire(self, priority: Priority, latency_key: str):
+        """Wait for a concurrency slot in priority order or shed the call"""
+        # Background work is shed at half depth so answers keep headroom
+        depth_limit = self.max_queue_depth
+        if priority > Priority.ANSWER:
+            depth_limit = max(1, depth_limit // 2)
+
+        if self._active < self.concurrency_limit and not self._waiting:
+            self._active += 1
+            return
+        if len(self._waiting) >= depth_limit:
+            raise ProviderOverloaded(self.name, self._retry_after(latency_key))
+
+        entry = [int(priority), next(self._seq)]
+        heapq.heappush(self._waiting, entry)
+        deadline = time.monotonic() + self.queue_timeout
+        while not (self._waiting[0] is entry and self._active < self.concurrency_limit):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise ProviderOverloaded(self.name, self._retry_after(latency_key))
+            self._cond.wait(remaining)
+
+        heapq.heappop(self._waiting)
+        self._active += 1
+        self._cond.notify_all()
+
+    def _adapt(self, latency_key: str, elapsed: float, success: bool, saturated: bool):
+        """
+        Adjust the concurrency limit from observed latency (AIMD)
+
+        Latency is tracked per call class so that cheap calls (a single query
+        embedding) are never compared against expensive ones (an indexing
+        batch). Failures shrink the limit but never touch the baseline, since
+        fast errors such as an immediate 429 say nothing about healthy latency.
+        """
+        if not success:
+            self._limit = max(1.0, self._limit * 0.9)
+            return
+
+        stats = self._latency.get(latency_key)
+        if stats is None:
+            # Seed both average and baseline from the first sample
+            self._latency[latency_key] = [elapsed, elapsed]
+            return
+        stats[0] = 0.8 * stats[0] + 0.2 * elapsed
+        # Let the baseline drift up slowly so it tracks the provider over time
+        stats[1] = min(elapsed, stats[1] * 1.01)
+
+        if stats[0] > LATENCY_TOLERANCE * stats[1]:
+            self._limit = max(1.0, self._limit * 0.9)
+        elif saturated:
+            self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+
+    def _release(self, latency_key: str, elapsed: float, success: bool, is_trial: bool):
+        """Free a slot and update latency and circuit state"""
+        saturated = self._active >= self.concurrency_limit
+        self._active -= 1
+        self._adapt(latency_key, elapsed, success, saturated)
+
+        if is_trial:
+            # Only the trial call decides whether a half-open circuit closes
+            self._trial_in_flight = False
+            if success:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._opened_at = time.monotonic()
+        elif self._opened_at is None:
+            # Calls admitted before the circuit opened do not change its state
+            if success:
+                self._failures = 0
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+        self._cond.notify_all()
+
+    def run(
+        self,
+        fn: Callable,
+        *args,
+        priority: Priority = Priority.ANSWER,
+        latency_key: Optional[str] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Run a provider call under admission control
+
+        Args:
+            fn: Callable performing the provider request
+            priority: Scheduling priority for this call
+            latency_key: Class of calls with comparable latency, e.g. "query"
+                or "documents" (default: the priority name)
+
+        Returns:
+            Result of fn
+
+        Raises:
+            ProviderOverloaded: If the call is shed or the circuit is open
+        """
+        if latency_key is None:
+            latency_key = Priority(priority).name.lower()
+
+        with self._cond:
+            is_trial = self._check_circuit()
+            try:
+                self._acquire(priority, latency_key)
+            except ProviderOverloaded:
+                if is_trial:
+                    self._trial_in_flight = False
+                raise
+
+        start = time.monotonic()
+        success = False
+        try:
+            result = fn(*args, **kwargs)
+            success = True
+            return result
+        finally:
+            with self._cond:
+                self._release(latency_key, time.monotonic() - start, success, is_trial)
+
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def _lane_limits(lane: str) -> Tuple[int, int]:
+    """
+    Resolve concurrency and queue depth for a lane
+
+    PROVIDER_LANE_LIMITS holds comma-separated "lane=concurrency:queue_depth"
+    overrides; lanes without one use the global defaults.
+    """
+    for entry in settings.PROVIDER_LANE_LIMITS.split(","):
+        name, _, limits = entry.strip().partition("=")
+        if name.strip().lower() != lane:
+            continue
+        concurrency, _, depth = limits.partition(":")
+        return (
+            int(concurrency) if concurrency.strip() else settings.PROVIDER_MAX_CONCURRENCY,
+            int(depth) if depth.strip() else settings.PROVIDER_MAX_QUEUE_DEPTH
+        )
+    return settings.PROVIDER_MAX_CONCURRENCY, settings.PROVIDER_MAX_QUEUE_DEPTH
+
+
+def get_scheduler(lane: str) -> ProviderScheduler:
+    """
+    Get the shared scheduler for a provider lane
+
+    Args:
+        lane: Lane name, e.g. "llm:openai" or "embedding:openai"
+
+    Returns:
+        ProviderScheduler instance for the lane
+    """
+    with _schedulers_lock:
+        if lane not in _schedulers:
+            max_concurrency, max_queue_depth = _lane_limits(lane)
+            _schedulers[lane] = ProviderScheduler(
+                name=lane,
+                max_concurrency=max_concurrency,
+                max_queue_depth=max_queue_depth,
+                queue_timeout=settings.PROVIDER_QUEUE_TIMEOUT,
+                failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.CIRCUIT_RESET_TIMEOUT
+            )
+        return _schedulers[lane]
@@ -5,7 +5,7 @@ Fetches and processes YouTube video transcripts
 import os
 import json
 import hashlib
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
 
@@ -110,6 +110,25 @@ class TranscriptLoader:
         transcript = self.fetch_transcript(video_id)
         return " ".join([item['text'] for item in transcript])
     
+    def iter_segments(self, video_id: str) -> Iterator[Dict]:
+        """
+        Iterate over transcript segments without joining them into one string
+        
+        The transcript is fetched eagerly so fetch errors are raised here,
+        not on first iteration.
+        
+        Args:
+            video_id: YouTube video ID
+        
+        Returns:
+            Iterator of transcript segments with 'text', 'start', and 'duration'
+        
+        Raises:
+            ValueError: If transcript cannot be fetched
+        """
+        transcript = self.fetch_transcript(video_id)
+        return iter(transcript)
+    
     def get_text_with_timestamps(self, video_id: str) -> str:
         """
         Get transcript text with timestamps